@@ -1,15 +1,43 @@
 #!/usr/bin/env python3
 """
 Cryptography utilities for encryption, decryption, and proxy re-encryption.
-Uses pyUmbral for PRE operations.
+Uses pyUmbral for PRE operations and AES-GCM (cryptography) for the payload.
 """
 
 import hashlib
+import os
+import struct
 import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Tuple, Optional
+from typing import Tuple, Optional, Union
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from umbral import pre, keys, signing
 
+from mmap_utils import map_file
+
+# Slice size used when streaming files through the hash
+HASH_CHUNK_SIZE = 1 << 20
+
+# Maximum number of parsed capsules kept per CryptoManager
+CAPSULE_CACHE_SIZE = 1024
+
+# Envelope encryption: the payload is sealed with AES-256-GCM under a random
+# data encryption key (DEK) and only the DEK goes through pyUmbral.
+# Ciphertext layout: [wrapped DEK length][wrapped DEK][nonce][AES-GCM ciphertext]
+DEK_SIZE = 32
+NONCE_SIZE = 12
+_WRAPPED_LEN = struct.Struct('>H')
+
+# Content hash for integrity checks: BLAKE3 (SIMD tree hashing) when the blake3
+# package is installed, otherwise SHA-256, which OpenSSL runs on SHA-NI / ARMv8
+# SHA2 where available and which beats stdlib BLAKE2b on such hardware
+try:
+    from blake3 import blake3 as _new_hash
+except ImportError:
+    _new_hash = hashlib.sha256
+
 # Try to set default curve if available
 try:
     from umbral import config as umbral_config
@@ -25,6 +53,37 @@ class CryptoManager:
     def __init__(self, keys_dir: Path):
         self.keys_dir = Path(keys_dir)
         self.keys_dir.mkdir(parents=True, exist_ok=True)
+        self._capsule_cache: OrderedDict[bytes, pre.Capsule] = OrderedDict()
+        self._signers: dict[bytes, signing.Signer] = {}
+        # Deserialized keys per user, so phases don't re-read and re-parse key files
+        self._pub_cache: dict[str, keys.PublicKey] = {}
+        self._priv_cache: dict[str, keys.SecretKey] = {}
+        # Serialized public keys, kept from when they were written or read
+        self._pub_bytes_cache: dict[str, bytes] = {}
+    
+    def _get_capsule(self, capsule_bytes: bytes) -> pre.Capsule:
+        """Deserialize a capsule, reusing previously parsed capsules (LRU)"""
+        capsule = self._capsule_cache.get(capsule_bytes)
+        if capsule is None:
+            capsule = pre.Capsule.from_bytes(capsule_bytes)
+            self._capsule_cache[capsule_bytes] = capsule
+            if len(self._capsule_cache) > CAPSULE_CACHE_SIZE:
+                self._capsule_cache.popitem(last=False)
+        else:
+            self._capsule_cache.move_to_end(capsule_bytes)
+        return capsule
+    
+    def _get_signer(self, private_key: keys.SecretKey) -> signing.Signer:
+        """Get a Signer for private_key, constructing it only once per key"""
+        key_bytes = private_key.to_secret_bytes()
+        signer = self._signers.get(key_bytes)
+        if signer is None:
+            try:
+                signer = signing.Signer(private_key=private_key)
+            except TypeError:
+                signer = signing.Signer(private_key)
+            self._signers[key_bytes] = signer
+        return signer
     
     def generate_keypair(self, user_id: str) -> Tuple[keys.SecretKey, keys.PublicKey]:
         """Generate a new key pair for a user"""
@@ -37,43 +96,99 @@ class CryptoManager:
         
         # Use correct serialization methods
         user_dir.joinpath('private_key.umbral').write_bytes(priv_key.to_secret_bytes())
-        user_dir.joinpath('public_key.umbral').write_bytes(bytes(pub_key))
+        pub_bytes = bytes(pub_key)
+        user_dir.joinpath('public_key.umbral').write_bytes(pub_bytes)
+        
+        # Seed the key caches so later phases never go back to disk for these
+        # keys (this also replaces any stale entries for the user)
+        self._pub_cache[user_id] = pub_key
+        self._pub_bytes_cache[user_id] = pub_bytes
+        self._priv_cache[user_id] = priv_key
         
         return priv_key, pub_key
     
+    def load_or_generate_keypair(self, user_id: str) -> Tuple[keys.SecretKey, keys.PublicKey, bool]:
+        """
+        Return the user's existing key pair if one is saved, otherwise generate it.
+        Returns: (private_key, public_key, reused)
+        """
+        user_dir = self.keys_dir / user_id
+        if (user_dir / 'private_key.umbral').exists() and (user_dir / 'public_key.umbral').exists():
+            return self.load_private_key(user_id), self.load_public_key(user_id), True
+        priv_key, pub_key = self.generate_keypair(user_id)
+        return priv_key, pub_key, False
+    
     def load_public_key(self, user_id: str) -> keys.PublicKey:
         """Load public key for a user"""
+        pub_key = self._pub_cache.get(user_id)
+        if pub_key is not None:
+            return pub_key
         pub_key_path = self.keys_dir / user_id / 'public_key.umbral'
         if not pub_key_path.exists():
             raise FileNotFoundError(f"Public key not found for {user_id}")
-        return keys.PublicKey.from_bytes(pub_key_path.read_bytes())
+        pub_bytes = pub_key_path.read_bytes()
+        pub_key = keys.PublicKey.from_bytes(pub_bytes)
+        self._pub_cache[user_id] = pub_key
+        self._pub_bytes_cache[user_id] = pub_bytes
+        return pub_key
+    
+    def public_key_bytes(self, user_id: str) -> bytes:
+        """Serialized public key for a user, without re-encoding the key point"""
+        pub_bytes = self._pub_bytes_cache.get(user_id)
+        if pub_bytes is None:
+            pub_bytes = bytes(self.load_public_key(user_id))
+            self._pub_bytes_cache[user_id] = pub_bytes
+        return pub_bytes
     
     def load_private_key(self, user_id: str) -> keys.SecretKey:
         """Load private key for a user"""
+        priv_key = self._priv_cache.get(user_id)
+        if priv_key is not None:
+            return priv_key
         priv_key_path = self.keys_dir / user_id / 'private_key.umbral'
         if not priv_key_path.exists():
             raise FileNotFoundError(f"Private key not found for {user_id}")
-        return keys.SecretKey.from_bytes(priv_key_path.read_bytes())
+        priv_key = keys.SecretKey.from_bytes(priv_key_path.read_bytes())
+        self._priv_cache[user_id] = priv_key
+        return priv_key
     
-    def encrypt(self, data: bytes, recipient_public_key: keys.PublicKey) -> Tuple[bytes, bytes, float]:
+    def encrypt(self, data: Union[bytes, memoryview], recipient_public_key: keys.PublicKey) -> Tuple[bytes, bytes, float]:
         """
         Encrypt data using recipient's public key.
+        data may be any contiguous buffer (e.g. a memoryview over an mmap'd file).
         Returns: (ciphertext, capsule, execution_time_ms)
         """
-        start_time = time.perf_counter()
+        start_time = time.perf_counter_ns()
         
-        capsule, ciphertext = pre.encrypt(recipient_public_key, data)
+        # Bulk payload goes through AES-GCM (AES-NI / ARMv8 AES via OpenSSL).
+        # The incremental encryptor reads buffers in place, where AESGCM.encrypt
+        # only takes bytes; the output (ciphertext + 16-byte tag) is the same
+        dek = os.urandom(DEK_SIZE)
+        nonce = os.urandom(NONCE_SIZE)
+        encryptor = Cipher(algorithms.AES(dek), modes.GCM(nonce)).encryptor()
+        body = b''.join((encryptor.update(data), encryptor.finalize(), encryptor.tag))
         
-        execution_time = (time.perf_counter() - start_time) * 1000  # ms
+        # Only the DEK is encrypted under the PRE scheme
+        capsule, wrapped_dek = pre.encrypt(recipient_public_key, dek)
+        ciphertext = b''.join((_WRAPPED_LEN.pack(len(wrapped_dek)), wrapped_dek, nonce, body))
+        
+        execution_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
         return ciphertext, bytes(capsule), execution_time
     
+    @staticmethod
+    def _split_ciphertext(ciphertext: bytes) -> Tuple[bytes, bytes, bytes]:
+        """Split an encrypt() ciphertext into (wrapped_dek, nonce, body)"""
+        (wrapped_len,) = _WRAPPED_LEN.unpack_from(ciphertext)
+        nonce_start = _WRAPPED_LEN.size + wrapped_len
+        body_start = nonce_start + NONCE_SIZE
+        return (ciphertext[_WRAPPED_LEN.size:nonce_start],
+                ciphertext[nonce_start:body_start],
+                ciphertext[body_start:])
+    
     def generate_reencryption_key(self, owner_private_key: keys.SecretKey,
                                   viewer_public_key: keys.PublicKey):
         """Generate re-encryption key (kfrags) for proxy re-encryption"""
-        try:
-            signer = signing.Signer(private_key=owner_private_key)
-        except TypeError:
-            signer = signing.Signer(owner_private_key)
+        signer = self._get_signer(owner_private_key)
         
         # Use correct parameter names for umbral 0.3.0
         kfrags = pre.generate_kfrags(
@@ -91,16 +206,16 @@ class CryptoManager:
         Returns the cfrag bytes (serialized).
         Returns: (cfrag_bytes, execution_time_ms)
         """
-        start_time = time.perf_counter()
+        start_time = time.perf_counter_ns()
         
         # Deserialize capsule
-        capsule = pre.Capsule.from_bytes(capsule_bytes)
+        capsule = self._get_capsule(capsule_bytes)
         
         # Re-encrypt using first kfrag (threshold=1, so only need one)
         cfrag = pre.reencrypt(kfrag=kfrags[0], capsule=capsule)
         
         # Serialize cfrag
-        execution_time = (time.perf_counter() - start_time) * 1000  # ms
+        execution_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
         return bytes(cfrag), execution_time
     
     def decrypt(self, ciphertext: bytes, capsule_bytes: bytes, 
@@ -109,15 +224,17 @@ class CryptoManager:
         Decrypt ciphertext using private key and capsule (original decryption).
         Returns: (plaintext, execution_time_ms)
         """
-        start_time = time.perf_counter()
+        start_time = time.perf_counter_ns()
         
         # Deserialize capsule
-        capsule = pre.Capsule.from_bytes(capsule_bytes)
+        capsule = self._get_capsule(capsule_bytes)
         
-        # Decrypt using decrypt_original (for owner)
-        plaintext = pre.decrypt_original(private_key, capsule, ciphertext)
+        # Unwrap the DEK using decrypt_original (for owner), then open the payload
+        wrapped_dek, nonce, body = self._split_ciphertext(ciphertext)
+        dek = pre.decrypt_original(private_key, capsule, wrapped_dek)
+        plaintext = AESGCM(dek).decrypt(nonce, body, None)
         
-        execution_time = (time.perf_counter() - start_time) * 1000  # ms
+        execution_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
         return plaintext, execution_time
     
     def decrypt_with_cfrag(self, ciphertext: bytes, original_capsule_bytes: bytes, 
@@ -127,30 +244,56 @@ class CryptoManager:
         Decrypt ciphertext using original capsule, cfrag, and viewer's private key.
         Returns: (plaintext, execution_time_ms)
         """
-        start_time = time.perf_counter()
+        start_time = time.perf_counter_ns()
         
         # Deserialize capsule and cfrag
-        capsule = pre.Capsule.from_bytes(original_capsule_bytes)
+        capsule = self._get_capsule(original_capsule_bytes)
         cfrag = pre.CapsuleFrag.from_bytes(cfrag_bytes)
         
         # Verify cfrag: verify(capsule, verifying_pk, delegating_pk, receiving_pk)
         viewer_public_key = viewer_private_key.public_key()
         verified_cfrag = cfrag.verify(capsule, owner_public_key, owner_public_key, viewer_public_key)
         
-        # Decrypt using decrypt_reencrypted (for viewer with cfrag)
-        plaintext = pre.decrypt_reencrypted(
+        # Unwrap the DEK using decrypt_reencrypted (for viewer with cfrag)
+        wrapped_dek, nonce, body = self._split_ciphertext(ciphertext)
+        dek = pre.decrypt_reencrypted(
             receiving_sk=viewer_private_key,
             delegating_pk=owner_public_key,
             capsule=capsule,
             verified_cfrags=[verified_cfrag],
-            ciphertext=ciphertext
+            ciphertext=wrapped_dek
         )
+        plaintext = AESGCM(dek).decrypt(nonce, body, None)
         
-        execution_time = (time.perf_counter() - start_time) * 1000  # ms
+        execution_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
         return plaintext, execution_time
     
+    # Hash constructor behind compute_hash / compute_hash_bytes, for callers
+    # that hash data incrementally
+    new_hash = staticmethod(_new_hash)
+    
     @staticmethod
-    def compute_hash(data: bytes) -> str:
-        """Compute SHA-256 hash of data"""
-        return hashlib.sha256(data).hexdigest()
-
+    def _hash(path_or_data: Union[bytes, str, Path]):
+        """
+        Feed data, or a file's contents when given a path, into a new hash object.
+        Files are mmap'd and fed to the hash in 1 MB slices so they are never
+        materialized as a single bytes object.
+        """
+        h = _new_hash()
+        if isinstance(path_or_data, (str, Path)):
+            with map_file(path_or_data) as mm, memoryview(mm) as view:
+                for off in range(0, len(view), HASH_CHUNK_SIZE):
+                    h.update(view[off:off + HASH_CHUNK_SIZE])
+        else:
+            h.update(path_or_data)
+        return h
+    
+    @staticmethod
+    def compute_hash_bytes(path_or_data: Union[bytes, str, Path]) -> bytes:
+        """Compute the raw 32-byte digest of data or a file (for comparisons)"""
+        return CryptoManager._hash(path_or_data).digest()
+    
+    @staticmethod
+    def compute_hash(path_or_data: Union[bytes, str, Path]) -> str:
+        """Compute hash of data or a file as a hex string (for display)"""
+        return CryptoManager._hash(path_or_data).hexdigest()
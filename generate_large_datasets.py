@@ -1,7 +1,8 @@
 #!/usr/bin/env python3
 """
 Generate large dataset files in datasets/ for performance testing.
-This writes repeating ASCII data in chunks to avoid high memory.
+This writes repeating ASCII data by filling an mmap of each file in place,
+so no large in-memory buffer is ever built.
 
 Files created:
 - 100MB.txt
@@ -12,47 +13,73 @@ Files created:
 Run from the HyPas-B directory:
 python generate_large_datasets.py
 """
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
 sizes_mb = [100, 200, 400, 600, 800]
 out_dir = Path('datasets')
-out_dir.mkdir(parents=True, exist_ok=True)
 
-# Use the provided 1KB file as the repeating block. This avoids inventing synthetic data
-# and produces realistic (copied) content for each large file.
-source_file = out_dir / '1KB.txt'
-if not source_file.exists():
-    raise SystemExit(f"Source file not found: {source_file}. Please place the 1KB template at {source_file}")
 
-content = source_file.read_bytes()
-chunk_len = len(content)
-if chunk_len == 0:
-    raise SystemExit(f"Source file {source_file} is empty")
-
-for mb in sizes_mb:
+def build(mb, content):
+    """Write out_dir/<mb>MB.txt by tiling content; returns the number of bytes written"""
+    chunk_len = len(content)
     path = out_dir / f"{mb}MB.txt"
     target_bytes = mb * 1024 * 1024
     repeats = target_bytes // chunk_len
     remainder = target_bytes % chunk_len
 
     print(f"Creating {path} ({mb} MB): chunk={chunk_len} bytes, repeats={repeats}, remainder={remainder} bytes")
-    written = 0
-    with path.open('wb') as f:
-        # write full repeats in a loop to avoid building a huge in-memory buffer
-        for i in range(repeats):
-            f.write(content)
-            written += chunk_len
-            # occasional progress update for long runs
-            if repeats >= 10 and (i + 1) % (max(1, repeats // 10)) == 0:
-                pct = int((i + 1) / repeats * 100)
-                print(f"  {pct}% ({(i+1)*chunk_len // (1024*1024)} MB) written...")
-
-        # write remainder (partial chunk) if needed
-        if remainder:
-            f.write(content[:remainder])
-            written += remainder
+    with path.open('wb+') as f:
+        # reserve the full size up front, then fill it through an mmap
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(f.fileno(), 0, target_bytes)
+        else:
+            f.truncate(target_bytes)
+        with mmap.mmap(f.fileno(), target_bytes) as mm:
+            # seed with one copy of the block, then keep doubling the filled
+            # prefix with in-place memmoves (log2(target/chunk) copies in total)
+            mm[0:chunk_len] = content
+            filled = chunk_len
+            while filled * 2 <= target_bytes:
+                mm.move(filled, 0, filled)
+                filled *= 2
+                if filled >= target_bytes // 10:
+                    print(f"  {path}: {filled * 100 // target_bytes}% ({filled // (1024*1024)} MB) written...")
+            # final partial copy of the prefix if needed
+            if filled < target_bytes:
+                mm.move(filled, 0, target_bytes - filled)
+                filled = target_bytes
+            mm.flush()
+    written = filled
 
     # final sanity print
     print(f"Wrote {written} bytes ({written / (1024*1024):.2f} MB) to {path}")
+    return written
+
+
+def main():
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    # Use the provided 1KB file as the repeating block. This avoids inventing synthetic data
+    # and produces realistic (copied) content for each large file.
+    source_file = out_dir / '1KB.txt'
+    if not source_file.exists():
+        raise SystemExit(f"Source file not found: {source_file}. Please place the 1KB template at {source_file}")
+
+    content = source_file.read_bytes()
+    if len(content) == 0:
+        raise SystemExit(f"Source file {source_file} is empty")
+
+    # Files are independent, so build them in parallel; each worker spends its
+    # time in memmove/page faults rather than in the interpreter
+    with ProcessPoolExecutor(max_workers=min(len(sizes_mb), os.cpu_count() or 1)) as ex:
+        list(ex.map(partial(build, content=content), sizes_mb))
+
+    print("Done.")
+
 
-print("Done.")
+if __name__ == '__main__':
+    main()
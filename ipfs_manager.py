@@ -3,36 +3,59 @@
 IPFS helper for uploading and downloading files.
 """
 
+import io
+import json
+import os
 import time
-import sys
 from pathlib import Path
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
 
-# Try to import from parent directory
-try:
-    from ipfs_pre.ipfs_helper import connect_ipfs
-except ImportError:
-    # Fallback: add parent directory to path
-    parent_dir = Path(__file__).resolve().parent.parent
-    sys.path.insert(0, str(parent_dir))
-    try:
-        from ipfs_pre.ipfs_helper import connect_ipfs
-    except ImportError:
-        # Last resort: use direct import with version bypass
-        import ipfshttpclient
-        def connect_ipfs(addr='/ip4/127.0.0.1/tcp/5001'):
-            try:
-                return ipfshttpclient.connect(addr)
-            except Exception as e:
-                if 'VersionMismatch' in type(e).__name__ or 'version' in str(e).lower():
-                    # Patch version check
-                    import ipfshttpclient.client as ipfs_client
-                    original_assert = ipfs_client.assert_version
-                    ipfs_client.assert_version = lambda *args, **kwargs: None
+import requests
+
+# Size of the slices read from the HTTP stream in download()
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+# Size of the slices upload() sends, matching the daemon's default chunker
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+
+def _multipart_body(parts, boundary: str) -> Iterator[bytes]:
+    """
+    Yield a multipart/form-data body for the add endpoint piece by piece.
+    parts is a list of (filename, content, content_type); content is either
+    bytes-like or a binary file object, and is sent in UPLOAD_CHUNK_SIZE slices.
+    Slices of bytes-like content are released as soon as they are sent (or
+    the generator is closed), so content may be backed by an mmap that the
+    caller closes afterwards.
+    """
+    for filename, content, content_type in parts:
+        yield (f'--{boundary}\r\n'
+               f'Content-Disposition: form-data; name="file"; filename="{filename}"\r\n'
+               f'Content-Type: {content_type}\r\n\r\n').encode()
+        if isinstance(content, (bytes, bytearray, memoryview)):
+            with memoryview(content) as view:
+                for off in range(0, len(view), UPLOAD_CHUNK_SIZE):
+                    chunk = view[off:off + UPLOAD_CHUNK_SIZE]
                     try:
-                        return ipfshttpclient.connect(addr)
+                        yield chunk
                     finally:
-                        ipfs_client.assert_version = original_assert
-                raise
+                        chunk.release()
+        else:
+            while chunk := content.read(UPLOAD_CHUNK_SIZE):
+                yield chunk
+        yield b'\r\n'
+    yield f'--{boundary}--\r\n'.encode()
+
+
+def multiaddr_to_api_url(addr: str) -> str:
+    """Translate an API multiaddr (e.g. /ip4/127.0.0.1/tcp/5001) to the HTTP API base URL"""
+    if not addr.startswith('/'):
+        return f"{addr.rstrip('/')}/api/v0"
+    parts = addr.strip('/').split('/')
+    host, port = parts[1], parts[3]
+    if parts[0] == 'ip6':
+        host = f"[{host}]"
+    scheme = 'https' if 'https' in parts else 'http'
+    return f"{scheme}://{host}:{port}/api/v0"
 
 
 class IPFSManager:
@@ -40,23 +63,43 @@ class IPFSManager:
     
     def __init__(self, ipfs_addr='/ip4/127.0.0.1/tcp/5001'):
         self.ipfs_addr = ipfs_addr
-        self._client = None
+        self._api_url = multiaddr_to_api_url(ipfs_addr)
+        self._session = requests.Session()
+        # Whether /records exists in IPFS Files; None until the first attempt
+        self._records_dir: Optional[bool] = None
     
-    def _get_client(self):
-        """Get or create IPFS client"""
-        if self._client is None:
-            self._client = connect_ipfs(self.ipfs_addr)
-        return self._client
+    def remove_records(self):
+        """Recursively remove /records from IPFS Files"""
+        response = self._session.post(
+            f"{self._api_url}/files/rm",
+            params={'arg': '/records', 'recursive': 'true', 'force': 'true'}
+        )
+        response.raise_for_status()
+        self._records_dir = None
     
-    def upload(self, data: bytes, filename: str = None, is_capsule: bool = False, is_original: bool = False) -> tuple[str, float, str]:
+    def ensure_records_dir(self) -> bool:
         """
-        Upload data to IPFS.
-        Returns: (cid, execution_time_ms)
+        Create the /records MFS directory once per manager.
+        Returns whether it exists. If it cannot be created a warning is printed
+        (once), and uploads are still added and pinned, just not linked into
+        IPFS Files.
         """
-        start_time = time.perf_counter()
-        client = self._get_client()
-
-        # Add appropriate file extension and metadata
+        if self._records_dir is None:
+            try:
+                response = self._session.post(
+                    f"{self._api_url}/files/mkdir",
+                    params={'arg': '/records', 'parents': 'true'}
+                )
+                response.raise_for_status()
+                self._records_dir = True
+            except Exception as e:
+                print(f"Warning: Could not create /records in IPFS Files: {e}")
+                self._records_dir = False
+        return self._records_dir
+    
+    @staticmethod
+    def _record_name(filename: str = None, is_capsule: bool = False, is_original: bool = False) -> str:
+        """Add the default extension for the payload type unless filename has one"""
         if filename is None:
             filename = f"record_{int(time.time())}"
 
@@ -64,79 +107,160 @@ class IPFSManager:
         has_ext = Path(filename).suffix != ''
 
         if is_capsule:
-            filename = f"{filename}" if has_ext else f"{filename}.capsule"
+            return f"{filename}" if has_ext else f"{filename}.capsule"
         elif is_original:
-            filename = f"{filename}" if has_ext else f"{filename}.txt"
+            return f"{filename}" if has_ext else f"{filename}.txt"
+        else:
+            return f"{filename}" if has_ext else f"{filename}.enc"
+
+    @staticmethod
+    def _metadata(filename: str, size: int, is_capsule: bool = False) -> bytes:
+        """
+        metadata.json stored next to the content.
+        Metadata travels in the same request as the content, so it cannot
+        carry the content CID; that is returned by the add itself.
+        """
+        return json.dumps({
+            "name": filename,
+            "type": "application/octet-stream" if is_capsule else "application/encrypted",
+            "size": size,
+            "timestamp": int(time.time())
+        }).encode()
+
+    def upload(self, data: Union[bytes, BinaryIO], filename: str = None, is_capsule: bool = False,
+               is_original: bool = False) -> tuple[str, float, str]:
+        """
+        Upload data to IPFS.
+        data may be bytes or a binary file object read from its current
+        position; either way it is streamed to the daemon in 256 KB slices.
+        Returns: (cid, execution_time_ms, mfs_path); mfs_path is '' when the
+        upload could not be linked into IPFS Files.
+        """
+        start_time = time.perf_counter_ns()
+
+        # Add appropriate file extension and metadata
+        filename = self._record_name(filename, is_capsule, is_original)
+
+        dir_path = f"/records/{filename}"
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            size = len(data)
         else:
-            filename = f"{filename}" if has_ext else f"{filename}.enc"
+            position = data.tell()
+            size = data.seek(0, io.SEEK_END) - position
+            data.seek(position)
 
-        # Upload raw data first
-        cid = client.add_bytes(data)
+        # /records must exist before the daemon can link into it
+        linked = self.ensure_records_dir()
+        params = {'wrap-with-directory': 'true', 'pin': 'true'}
+        if linked:
+            params['to-files'] = dir_path
         
-        # Pin the file to ensure persistence
+        # Single round trip: add + pin content and metadata.json, wrapped in a
+        # directory that the daemon links into MFS (Files tab in WebUI)
+        boundary = os.urandom(16).hex()
+        body = _multipart_body([
+            ('content', data, 'application/octet-stream'),
+            ('metadata.json', self._metadata(filename, size, is_capsule), 'application/json')
+        ], boundary)
         try:
-            client.pin.add(cid)
-            
-            # Add to MFS (Files tab in WebUI)
-            mfs_path = f"/records/{filename}"
-            
-            # Create directory if it doesn't exist
-            try:
-                client.files.mkdir("/records", parents=True)
-            except Exception:
-                pass  # Directory might already exist
-                
-            # Add to MFS with proper naming and create metadata file
-            try:
-                # Create records directory
-                client.files.mkdir("/records", parents=True)
-                
-                # Create content directory for this file
-                dir_path = f"/records/{filename}"
-                client.files.mkdir(dir_path, parents=True)
-                
-                # Add content file
-                content_path = f"{dir_path}/content"
-                client.files.cp(f"/ipfs/{cid}", content_path)
-                
-                # Create metadata file
-                metadata = {
-                    "name": filename,
-                    "type": "application/octet-stream" if is_capsule else "application/encrypted",
-                    "size": len(data),
-                    "cid": cid,
-                    "timestamp": int(time.time())
-                }
-                
-                # Add metadata to MFS
-                metadata_cid = client.add_json(metadata)
-                client.files.cp(f"/ipfs/{metadata_cid}", f"{dir_path}/metadata.json")
-                
-                print(f"File added to IPFS Files: {dir_path}")
-                mfs_path = dir_path
-                    
-            except Exception as e:
-                print(f"Warning: Could not add to IPFS Files: {e}")
-                
-        except Exception as e:
-            print(f"Warning: Pin operation failed: {e}")
+            response = self._session.post(
+                f"{self._api_url}/add",
+                params=params,
+                headers={'Content-Type': f'multipart/form-data; boundary={boundary}'},
+                data=body
+            )
+        finally:
+            # A request that failed mid-body leaves the generator suspended on
+            # a slice of data; closing it releases that slice
+            body.close()
+        response.raise_for_status()
         
-        execution_time = (time.perf_counter() - start_time) * 1000  # ms
-        # If mfs_path wasn't set (e.g., MFS operations failed), set to empty string
-        try:
-            mfs_path
-        except NameError:
-            mfs_path = ''
+        # The daemon answers with one JSON object per added entry
+        entries = [json.loads(line) for line in response.text.splitlines() if line]
+        cid = next(entry['Hash'] for entry in entries if entry['Name'] == 'content')
+        mfs_path = ''
+        if linked:
+            print(f"File added to IPFS Files: {dir_path}")
+            mfs_path = dir_path
+        
+        execution_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
         return cid, execution_time, mfs_path
     
-    def download(self, cid: str) -> tuple[bytes, float]:
+    def upload_many(self, items: List[Tuple[bytes, str, dict]]) -> List[Tuple[str, float, str]]:
+        """
+        Upload several payloads with a single add request.
+        Each item is (data, filename, options) where options holds the
+        is_capsule / is_original flags accepted by upload().
+        Every entry is then linked into /records with files/cp.
+        Returns: [(cid, execution_time_ms, mfs_path)] in item order; the time is
+        the whole batch round trip, since the items share one request. As with
+        upload(), mfs_path is '' for an item that could not be linked.
+        """
+        start_time = time.perf_counter_ns()
+
+        names = []
+        files = []
+        for data, filename, options in items:
+            is_capsule = options.get('is_capsule', False)
+            name = self._record_name(filename, is_capsule, options.get('is_original', False))
+            names.append(name)
+            # One directory per item, laid out exactly like upload() does
+            files.append(('file', (name, b'', 'application/x-directory')))
+            files.append(('file', (f"{name}/content", data, 'application/octet-stream')))
+            files.append(('file', (f"{name}/metadata.json", self._metadata(name, len(data), is_capsule),
+                                   'application/json')))
+
+        records_dir = self.ensure_records_dir()
+
+        response = self._session.post(
+            f"{self._api_url}/add",
+            params={'wrap-with-directory': 'true', 'pin': 'true'},
+            files=files
+        )
+        response.raise_for_status()
+        entries = {}
+        for line in response.text.splitlines():
+            if line:
+                entry = json.loads(line)
+                entries[entry['Name']] = entry['Hash']
+
+        linked = []
+        for name in names:
+            mfs_path = ''
+            if records_dir:
+                dir_path = f"/records/{name}"
+                try:
+                    response = self._session.post(
+                        f"{self._api_url}/files/cp",
+                        params=[('arg', f"/ipfs/{entries[name]}"), ('arg', dir_path)]
+                    )
+                    response.raise_for_status()
+                    print(f"File added to IPFS Files: {dir_path}")
+                    mfs_path = dir_path
+                except Exception as e:
+                    print(f"Warning: Could not add to IPFS Files: {e}")
+            linked.append((entries[f"{name}/content"], mfs_path))
+
+        execution_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
+        return [(cid, execution_time, mfs_path) for cid, mfs_path in linked]
+    
+    def download(self, cid: str, new_hash) -> tuple[bytes, bytes, float]:
         """
-        Download data from IPFS.
-        Returns: (data, execution_time_ms)
+        Download data from IPFS, hashing it as it streams in.
+        new_hash is the hash constructor to use; pass CryptoManager.new_hash so
+        the digest matches the ones stored on chain (there is no default, as
+        that may be BLAKE3 or SHA-256 depending on what is installed).
+        Returns: (data, digest, execution_time_ms)
         """
-        start_time = time.perf_counter()
-        client = self._get_client()
-        data = client.cat(cid)
-        execution_time = (time.perf_counter() - start_time) * 1000  # ms
-        return data, execution_time
+        start_time = time.perf_counter_ns()
+        h = new_hash()
+        chunks = []
+        with self._session.post(f"{self._api_url}/cat", params={'arg': cid},
+                                stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                h.update(chunk)
+                chunks.append(chunk)
+        execution_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
+        return b''.join(chunks), h.digest(), execution_time
 
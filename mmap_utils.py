@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+Read-only memory mapping of input files (datasets, reports, hashed files).
+"""
+
+import mmap
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def map_file(path):
+    """
+    Map a file read-only and yield the map.
+    mmap cannot map an empty file, so an empty file yields b'' instead.
+    If an exception is already propagating while a slice of the map is still
+    referenced (e.g. from the failing frames), closing the map raises
+    BufferError; that is not allowed to replace the original error, and the
+    map is then freed together with its last view.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mm
+        except BaseException:
+            try:
+                mm.close()
+            except BufferError:
+                pass
+            raise
+        mm.close()
@@ -5,8 +5,9 @@ Simple in-memory storage for performance testing.
 """
 
 import time
-import hashlib
-from typing import Dict, Optional, Tuple
+from array import array
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
@@ -17,7 +18,7 @@ class Role(Enum):
     VIEWER = "Viewer"
 
 
-@dataclass
+@dataclass(slots=True)
 class User:
     user_id: str
     role: Role
@@ -25,24 +26,24 @@ class User:
     registered_at: float
 
 
-@dataclass
+@dataclass(slots=True)
 class Record:
     record_id: str
     owner_vid: str
     uploader_vid: str
     cid: str
-    hash: str
+    hash: bytes
     stored_at: float
 
 
-@dataclass
+@dataclass(slots=True)
 class Consent:
     owner_vid: str
     viewer_vid: str
     record_id: str
     status: str  # "requested", "approved", "revoked"
     capsule_cid: Optional[str] = None
-    capsule_hash: Optional[str] = None
+    capsule_hash: Optional[bytes] = None
     created_at: float = 0.0
     updated_at: float = 0.0
 
@@ -56,22 +57,95 @@ class MockBlockchain:
     def reset(self):
         """Reset all blockchain state"""
         self.users: Dict[str, User] = {}
-        self.records: Dict[str, Record] = {}
-        self.consents: Dict[str, Consent] = {}
-        self.audit_log: list = []
+        # Records are stored column-wise (one list per field plus an index);
+        # get_record builds a Record object only when one is asked for
+        self._rec_idx: Dict[str, int] = {}
+        self._rec_owner: List[str] = []
+        self._rec_uploader: List[str] = []
+        self._rec_cid: List[str] = []
+        self._rec_hash: List[bytes] = []
+        self._rec_ts = array('d')
+        self.consents: Dict[Tuple[str, str, str], Consent] = {}
+        # Audit trail kept as parallel columns (timestamps unboxed in an array);
+        # audit_log rebuilds the entry dicts
+        self._audit_ts = array('d')
+        self._audit_action: List[str] = []
+        self._audit_details: List[dict] = []
+        # Calls queued by an open batch (None when not batching)
+        self._pending: Optional[List[Tuple[Callable, tuple]]] = None
+        self.last_commit_time_ms = 0.0
+    
+    def begin_batch(self):
+        """Start queueing state-changing calls until commit_batch()"""
+        if self._pending is not None:
+            raise ValueError("A batch is already in progress")
+        self._pending = []
+    
+    def commit_batch(self) -> float:
+        """
+        Apply all queued calls in submission order and return execution time.
+        Calls are applied one by one, so a failing call leaves earlier ones applied.
+        """
+        if self._pending is None:
+            raise ValueError("No batch in progress")
+        pending, self._pending = self._pending, None
+        start_time = time.perf_counter_ns()
+        
+        for method, args in pending:
+            method(*args)
+        
+        execution_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
+        self.last_commit_time_ms = execution_time
+        return execution_time
+    
+    @contextmanager
+    def batch(self):
+        """
+        Queue register/store/request/approve/revoke calls and apply them together
+        on exit (a real chain backend would submit them as one multicall).
+        Queued calls return 0.0; the commit time is kept in last_commit_time_ms.
+        Reads inside the block see state as of the last commit. If the block
+        raises, the queued calls are discarded.
+        """
+        self.begin_batch()
+        try:
+            yield self
+        except BaseException:
+            self._pending = None
+            raise
+        self.commit_batch()
+    
+    def _defer(self, method: Callable, *args) -> bool:
+        """Queue a call if a batch is open; returns False when not batching"""
+        if self._pending is None:
+            return False
+        self._pending.append((method, args))
+        return True
+    
+    @property
+    def records(self) -> Dict[str, Record]:
+        """Snapshot of all stored records keyed by record ID"""
+        return {record_id: self.get_record(record_id) for record_id in self._rec_idx}
+    
+    @property
+    def audit_log(self) -> list:
+        """Audit entries as {'timestamp', 'action', 'details'} dicts"""
+        return [
+            {'timestamp': ts, 'action': action, 'details': details}
+            for ts, action, details in zip(self._audit_ts, self._audit_action, self._audit_details)
+        ]
     
     def _log_audit(self, action: str, details: dict):
         """Log an audit entry"""
-        entry = {
-            'timestamp': time.time(),
-            'action': action,
-            'details': details
-        }
-        self.audit_log.append(entry)
+        self._audit_ts.append(time.time())
+        self._audit_action.append(action)
+        self._audit_details.append(details)
     
     def register_user(self, user_id: str, role: Role, public_key: bytes) -> float:
         """PHASE 1: Register user and return execution time"""
-        start_time = time.perf_counter()
+        if self._defer(self.register_user, user_id, role, public_key):
+            return 0.0
+        start_time = time.perf_counter_ns()
         
         if user_id in self.users:
             raise ValueError(f"User {user_id} already registered")
@@ -88,25 +162,25 @@ class MockBlockchain:
             'role': role.value
         })
         
-        execution_time = (time.perf_counter() - start_time) * 1000  # ms
+        execution_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
         return execution_time
     
     def store_record(self, record_id: str, owner_vid: str, uploader_vid: str, 
-                     cid: str, file_hash: str) -> float:
+                     cid: str, file_hash: bytes) -> float:
         """PHASE 4: Store record metadata and return execution time"""
-        start_time = time.perf_counter()
+        if self._defer(self.store_record, record_id, owner_vid, uploader_vid, cid, file_hash):
+            return 0.0
+        start_time = time.perf_counter_ns()
         
-        if record_id in self.records:
+        if record_id in self._rec_idx:
             raise ValueError(f"Record {record_id} already exists")
         
-        self.records[record_id] = Record(
-            record_id=record_id,
-            owner_vid=owner_vid,
-            uploader_vid=uploader_vid,
-            cid=cid,
-            hash=file_hash,
-            stored_at=time.time()
-        )
+        self._rec_idx[record_id] = len(self._rec_cid)
+        self._rec_owner.append(owner_vid)
+        self._rec_uploader.append(uploader_vid)
+        self._rec_cid.append(cid)
+        self._rec_hash.append(file_hash)
+        self._rec_ts.append(time.time())
         
         self._log_audit('store_record', {
             'record_id': record_id,
@@ -115,21 +189,33 @@ class MockBlockchain:
             'cid': cid
         })
         
-        execution_time = (time.perf_counter() - start_time) * 1000  # ms
+        execution_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
         return execution_time
     
     def get_record(self, record_id: str) -> Optional[Record]:
         """Get record by ID"""
-        return self.records.get(record_id)
+        idx = self._rec_idx.get(record_id)
+        if idx is None:
+            return None
+        return Record(
+            record_id=record_id,
+            owner_vid=self._rec_owner[idx],
+            uploader_vid=self._rec_uploader[idx],
+            cid=self._rec_cid[idx],
+            hash=self._rec_hash[idx],
+            stored_at=self._rec_ts[idx]
+        )
     
     def request_access(self, owner_vid: str, viewer_vid: str, record_id: str) -> float:
         """PHASE 5: Request access and return execution time"""
-        start_time = time.perf_counter()
+        if self._defer(self.request_access, owner_vid, viewer_vid, record_id):
+            return 0.0
+        start_time = time.perf_counter_ns()
         
-        consent_key = f"{owner_vid}:{viewer_vid}:{record_id}"
+        consent_key = (owner_vid, viewer_vid, record_id)
         
         if consent_key in self.consents:
-            raise ValueError(f"Consent already exists for {consent_key}")
+            raise ValueError(f"Consent already exists for {':'.join(consent_key)}")
         
         self.consents[consent_key] = Consent(
             owner_vid=owner_vid,
@@ -146,18 +232,21 @@ class MockBlockchain:
             'record_id': record_id
         })
         
-        execution_time = (time.perf_counter() - start_time) * 1000  # ms
+        execution_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
         return execution_time
     
     def approve_access(self, owner_vid: str, viewer_vid: str, record_id: str,
-                      capsule_cid: str, capsule_hash: str) -> float:
+                      capsule_cid: str, capsule_hash: bytes) -> float:
         """PHASE 6: Approve access and return execution time"""
-        start_time = time.perf_counter()
+        if self._defer(self.approve_access, owner_vid, viewer_vid, record_id,
+                       capsule_cid, capsule_hash):
+            return 0.0
+        start_time = time.perf_counter_ns()
         
-        consent_key = f"{owner_vid}:{viewer_vid}:{record_id}"
+        consent_key = (owner_vid, viewer_vid, record_id)
         
         if consent_key not in self.consents:
-            raise ValueError(f"Consent not found for {consent_key}")
+            raise ValueError(f"Consent not found for {':'.join(consent_key)}")
         
         consent = self.consents[consent_key]
         consent.status = "approved"
@@ -172,17 +261,19 @@ class MockBlockchain:
             'capsule_cid': capsule_cid
         })
         
-        execution_time = (time.perf_counter() - start_time) * 1000  # ms
+        execution_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
         return execution_time
     
     def revoke_access(self, owner_vid: str, viewer_vid: str, record_id: str) -> float:
         """PHASE 8: Revoke access and return execution time"""
-        start_time = time.perf_counter()
+        if self._defer(self.revoke_access, owner_vid, viewer_vid, record_id):
+            return 0.0
+        start_time = time.perf_counter_ns()
         
-        consent_key = f"{owner_vid}:{viewer_vid}:{record_id}"
+        consent_key = (owner_vid, viewer_vid, record_id)
         
         if consent_key not in self.consents:
-            raise ValueError(f"Consent not found for {consent_key}")
+            raise ValueError(f"Consent not found for {':'.join(consent_key)}")
         
         consent = self.consents[consent_key]
         consent.status = "revoked"
@@ -196,11 +287,11 @@ class MockBlockchain:
             'record_id': record_id
         })
         
-        execution_time = (time.perf_counter() - start_time) * 1000  # ms
+        execution_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
         return execution_time
     
     def get_consent(self, owner_vid: str, viewer_vid: str, record_id: str) -> Optional[Consent]:
         """Get consent status"""
-        consent_key = f"{owner_vid}:{viewer_vid}:{record_id}"
+        consent_key = (owner_vid, viewer_vid, record_id)
         return self.consents.get(consent_key)
 
@@ -2,71 +2,83 @@ import re
 import csv
 from pathlib import Path
 
-def extract_phase_times(log_content):
-    # Dictionary to store phase timings
-    phases = {}
-    
-    # Regular expressions for phase extraction
-    phase_pattern = r'\[PHASE (\d+)\].*?completed \((\d+\.\d+) ms\)'
+from mmap_utils import map_file
+
+# Single pass over the log: one alternative per metric line, told apart by
+# which capture group matched last. Patterns are bytes so they can run
+# directly over the mmap'd report without decoding it.
+_PAT = re.compile(
+    rb'\[PHASE (\d+)\].*?completed \((\d+\.\d+) ms\)'
+    rb'|Total Time: (\d+\.\d+) ms'
+    rb'|Throughput: (\d+\.\d+) MB/s'
+    rb'|Max Memory: (\d+\.\d+) MB'
+)
+
+_SECTION_MARKER = b"Testing with"
+_RUN_BANNER = b"Starting Full 8-Phase Simulation"
+
+# Column order of the averaged metrics in each CSV row, and their formats
+_METRIC_KEYS = list(range(1, 9)) + ['total', 'throughput', 'memory']
+_METRIC_FORMATS = ['.2f'] * 8 + ['.2f', '.3f', '.2f']
+
+def _split_spans(buf, sep, start, end):
+    # (start, end) offsets of the pieces buf[start:end].split(sep) would return,
+    # without copying any of them
+    while True:
+        idx = buf.find(sep, start, end)
+        if idx == -1:
+            yield start, end
+            return
+        yield start, idx
+        start = idx + len(sep)
+
+def extract_phase_times(log_content, start=0, end=None):
+    if end is None:
+        end = len(log_content)
     
     # Find all phase timings
     current_run = {}
-    for line in log_content.split('\n'):
-        phase_match = re.search(phase_pattern, line)
-        if phase_match:
-            phase_num = int(phase_match.group(1))
-            time = float(phase_match.group(2))
-            current_run[phase_num] = time
-            
-        total_match = re.search(r'Total Time: (\d+\.\d+) ms', line)
-        if total_match:
-            current_run['total'] = float(total_match.group(1))
-            
-        throughput_match = re.search(r'Throughput: (\d+\.\d+) MB/s', line)
-        if throughput_match:
-            current_run['throughput'] = float(throughput_match.group(1))
-            
-        memory_match = re.search(r'Max Memory: (\d+\.\d+) MB', line)
-        if memory_match:
-            current_run['memory'] = float(memory_match.group(1))
+    for m in _PAT.finditer(log_content, start, end):
+        g = m.lastindex
+        if g == 2:
+            current_run[int(m.group(1))] = float(m.group(2))
+        elif g == 3:
+            current_run['total'] = float(m.group(3))
+        elif g == 4:
+            current_run['throughput'] = float(m.group(4))
+        elif g == 5:
+            current_run['memory'] = float(m.group(5))
             
     return current_run
 
-def process_size_section(content):
+def process_size_section(content, start=0, end=None):
+    if end is None:
+        end = len(content)
     runs = []
-    current_run = ""
     
-    for line in content.split('\n'):
-        if "Starting Full 8-Phase Simulation" in line:
-            if current_run:
-                phases = extract_phase_times(current_run)
-                if phases:
-                    runs.append(phases)
-            current_run = ""
-        current_run += line + "\n"
-        
-    # Don't forget the last run
-    if current_run:
-        phases = extract_phase_times(current_run)
+    # Each run starts at a simulation banner; anything before the first banner
+    # is treated as a run of its own, as it always was
+    for run_start, run_end in _split_spans(content, _RUN_BANNER, start, end):
+        phases = extract_phase_times(content, run_start, run_end)
         if phases:
             runs.append(phases)
             
     return runs
 
 def main():
-    # Read the log file
-    with open('results/analysis_report_20251105_195458.md', 'r') as f:
-        content = f.read()
-    
-    # Split into sections by file size
-    sections = content.split("Testing with")
-    size_data = {}
-    
-    for section in sections[1:]:  # Skip the first empty section
-        size = section.split('...')[0].strip()
-        runs = process_size_section(section)
-        if runs:
-            size_data[size] = runs
+    # Map the log file read-only; the regexes run over it as bytes
+    with map_file('results/analysis_report_20251105_195458.md') as content:
+        # Split into sections by file size
+        sections = _split_spans(content, _SECTION_MARKER, 0, len(content))
+        next(sections)  # Skip the first empty section
+        size_data = {}
+        
+        for start, end in sections:
+            size_end = content.find(b'...', start, end)
+            size = content[start:end if size_end == -1 else size_end].strip().decode()
+            runs = process_size_section(content, start, end)
+            if runs:
+                size_data[size] = runs
     
     # Process results
     results = []
@@ -74,34 +86,14 @@ def main():
               'Phase 6', 'Phase 7', 'Phase 8', 'Total Time', 'Throughput', 'Max Memory']
     
     for size, runs in size_data.items():
-        # Calculate averages
-        avg_phases = {i: 0.0 for i in range(1, 9)}
-        avg_total = 0.0
-        avg_throughput = 0.0
-        avg_memory = 0.0
-        
-        for run in runs:
-            for phase in range(1, 9):
-                avg_phases[phase] += run.get(phase, 0)
-            avg_total += run.get('total', 0)
-            avg_throughput += run.get('throughput', 0)
-            avg_memory += run.get('memory', 0)
-        
         n_runs = len(runs)
         if n_runs > 0:
-            for phase in avg_phases:
-                avg_phases[phase] /= n_runs
-            avg_total /= n_runs
-            avg_throughput /= n_runs
-            avg_memory /= n_runs
+            # One row of metrics per run; average each column in a single pass
+            rows = [[run.get(key, 0) for key in _METRIC_KEYS] for run in runs]
+            avgs = [sum(column) / n_runs for column in zip(*rows)]
             
             row = [size]
-            row.extend([f"{avg_phases[phase]:.2f}" for phase in range(1, 9)])
-            row.extend([
-                f"{avg_total:.2f}",
-                f"{avg_throughput:.3f}",
-                f"{avg_memory:.2f}"
-            ])
+            row.extend(f"{avg:{fmt}}" for avg, fmt in zip(avgs, _METRIC_FORMATS))
             results.append(row)
     
     # Write to CSV
@@ -111,4 +103,4 @@ def main():
         writer.writerows(results)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
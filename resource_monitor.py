@@ -5,11 +5,12 @@ Resource monitoring for CPU and memory usage during simulation.
 
 import psutil
 import time
+from array import array
 from typing import Dict, List, Optional
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class ResourceSnapshot:
     """Single snapshot of resource usage"""
     timestamp: float
@@ -25,45 +26,72 @@ class ResourceMonitor:
     
     def __init__(self):
         self.process = psutil.Process()
-        self.snapshots: List[ResourceSnapshot] = []
+        # Snapshots are stored column-wise, one array('d') per ResourceSnapshot
+        # field, so get_stats reduces over unboxed doubles
+        self._timestamps = array('d')
+        self._cpu_percents = array('d')
+        self._memory_percents = array('d')
+        self._memory_mbs = array('d')
+        self._cpu_users = array('d')
+        self._cpu_systems = array('d')
         self.start_time: Optional[float] = None
         self.end_time: Optional[float] = None
     
+    @property
+    def snapshots(self) -> List[ResourceSnapshot]:
+        """All snapshots taken so far, oldest first"""
+        return [
+            ResourceSnapshot(*fields)
+            for fields in zip(self._timestamps, self._cpu_percents, self._memory_percents,
+                              self._memory_mbs, self._cpu_users, self._cpu_systems)
+        ]
+    
     def start(self):
-        """Start monitoring"""
+        """
+        Start monitoring.
+        CPU percentages are measured since the previous sample without blocking.
+        The snapshot taken here only primes that measurement and records 0.0
+        CPU, which get_stats leaves out of the CPU figures.
+        """
         self.start_time = time.time()
-        self.snapshots.clear()
-        self._take_snapshot()
+        for column in (self._timestamps, self._cpu_percents, self._memory_percents,
+                       self._memory_mbs, self._cpu_users, self._cpu_systems):
+            del column[:]
+        self._take_snapshot(prime_cpu=True)
     
     def stop(self):
         """Stop monitoring"""
         self.end_time = time.time()
         self._take_snapshot()
     
-    def _take_snapshot(self):
-        """Take a snapshot of current resource usage"""
+    def _take_snapshot(self, prime_cpu: bool = False):
+        """
+        Take a snapshot of current resource usage.
+        With prime_cpu, psutil's CPU counter is (re)started and 0.0 is recorded:
+        a reading over the few microseconds since an earlier call is noise.
+        """
         try:
-            cpu_percent = self.process.cpu_percent(interval=0.1)
+            cpu_percent = self.process.cpu_percent(interval=None)
+            if prime_cpu:
+                cpu_percent = 0.0
             memory_info = self.process.memory_info()
             memory_percent = self.process.memory_percent()
             cpu_times = self.process.cpu_times()
             
-            snapshot = ResourceSnapshot(
-                timestamp=time.time(),
-                cpu_percent=cpu_percent,
-                memory_percent=memory_percent,
-                memory_mb=memory_info.rss / (1024 * 1024),  # Convert to MB
-                cpu_user=cpu_times.user,
-                cpu_system=cpu_times.system
-            )
-            self.snapshots.append(snapshot)
+            self._timestamps.append(time.time())
+            self._cpu_percents.append(cpu_percent)
+            self._memory_percents.append(memory_percent)
+            self._memory_mbs.append(memory_info.rss / (1024 * 1024))  # Convert to MB
+            self._cpu_users.append(cpu_times.user)
+            self._cpu_systems.append(cpu_times.system)
         except Exception as e:
             # If monitoring fails, continue silently
             pass
     
     def get_stats(self) -> Dict:
         """Get statistics about resource usage"""
-        if not self.snapshots:
+        num_snapshots = len(self._timestamps)
+        if not num_snapshots:
             return {
                 'avg_cpu_percent': 0.0,
                 'max_cpu_percent': 0.0,
@@ -75,9 +103,9 @@ class ResourceMonitor:
                 'duration': 0.0
             }
         
-        cpu_percents = [s.cpu_percent for s in self.snapshots if s.cpu_percent > 0]
-        memory_mbs = [s.memory_mb for s in self.snapshots]
-        memory_percents = [s.memory_percent for s in self.snapshots]
+        cpu_percents = [c for c in self._cpu_percents if c > 0]
+        memory_mbs = self._memory_mbs
+        memory_percents = self._memory_percents
         
         duration = 0.0
         if self.start_time and self.end_time:
@@ -86,11 +114,10 @@ class ResourceMonitor:
         return {
             'avg_cpu_percent': sum(cpu_percents) / len(cpu_percents) if cpu_percents else 0.0,
             'max_cpu_percent': max(cpu_percents) if cpu_percents else 0.0,
-            'avg_memory_mb': sum(memory_mbs) / len(memory_mbs) if memory_mbs else 0.0,
-            'max_memory_mb': max(memory_mbs) if memory_mbs else 0.0,
-            'avg_memory_percent': sum(memory_percents) / len(memory_percents) if memory_percents else 0.0,
-            'max_memory_percent': max(memory_percents) if memory_percents else 0.0,
+            'avg_memory_mb': sum(memory_mbs) / num_snapshots,
+            'max_memory_mb': max(memory_mbs),
+            'avg_memory_percent': sum(memory_percents) / num_snapshots,
+            'max_memory_percent': max(memory_percents),
             'duration': duration,
-            'num_snapshots': len(self.snapshots)
+            'num_snapshots': num_snapshots
         }
-
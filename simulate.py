@@ -5,46 +5,222 @@ Collects execution time, throughput, CPU/memory usage metrics.
 """
 
 import json
+import math
 import time
 import csv
+import io
+import os
+import shutil
 import sys
 import argparse
+import cProfile
+from array import array
 from pathlib import Path
 from typing import Dict, List
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager, redirect_stdout
+from datetime import datetime, timedelta
+from functools import lru_cache
 
+from mmap_utils import map_file
 from mock_blockchain import Role
 from phase_simulator import PhaseSimulator
 from resource_monitor import ResourceMonitor
 
+# orjson is optional; the standard library encoder produces the same document
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Timing metrics the phases report (see PhaseSimulator); these are the
+# per-phase values copied into the CSV summary
+_CSV_TIME_KEYS = frozenset({
+    'total_time_ms',
+    'keygen_time_ms',
+    'blockchain_time_ms',
+    'encrypt_time_ms',
+    'original_upload_time_ms',
+    'encrypted_upload_time_ms',
+    're_key_generation_time_ms',
+    'reencrypt_time_ms',
+    'capsule_upload_time_ms',
+    'cipher_download_time_ms',
+    'capsule_download_time_ms',
+    'decrypt_time_ms',
+})
+
+# (phase, metric) columns summarised across runs in batch_aggregate.json,
+# in output order
+PHASE_METRIC_COLUMNS = (
+    ('phase1', 'total_time_ms'),
+    ('phase2', 'encrypt_time_ms'),
+    ('phase3', 'original_upload_time_ms'),
+    ('phase3', 'encrypted_upload_time_ms'),
+    ('phase3', 'total_time_ms'),
+    ('phase4', 'blockchain_time_ms'),
+    ('phase5', 'blockchain_time_ms'),
+    ('phase6', 're_key_generation_time_ms'),
+    ('phase6', 'reencrypt_time_ms'),
+    ('phase6', 'capsule_upload_time_ms'),
+    ('phase6', 'blockchain_time_ms'),
+    ('phase6', 'total_time_ms'),
+    ('phase7', 'cipher_download_time_ms'),
+    ('phase7', 'capsule_download_time_ms'),
+    ('phase7', 'decrypt_time_ms'),
+    ('phase7', 'total_time_ms'),
+    ('phase8', 'blockchain_time_ms'),
+)
+
+_PHASE_NAMES = (
+    "User Registration",
+    "Data Encryption",
+    "IPFS Storage",
+    "On-chain Storage",
+    "Access Request",
+    "Consent Approval + Proxy Re-Encryption",
+    "Data Retrieval + Decryption",
+    "Access Revocation",
+)
+# Progress line for each phase: header and completion line in one string, so
+# each phase is a single format call and a single print
+_PHASE_TEMPLATES = {
+    n: f"\n[PHASE {n}] {name}...\n  ✓ Phase {n} completed ({{t:.2f}} ms)"
+    for n, name in enumerate(_PHASE_NAMES, start=1)
+}
+_PHASE7_VERIFIED = _PHASE_TEMPLATES[7] + "\n  ✓ Decryption verified: {size} bytes"
+_PHASE7_MISMATCH = f"\n[PHASE 7] {_PHASE_NAMES[6]}...\n  ⚠ Phase 7 completed but size mismatch!"
+
+
+def _aggregate_phase_metrics(all_results: List[Dict]) -> Dict[str, Dict[str, float]]:
+    """
+    Summarise every PHASE_METRIC_COLUMNS column over the runs.
+    Each column is gathered into an array('d') once (one row per run), then
+    reduced to min/max/mean and the nearest-rank 95th percentile.
+    """
+    summary = {}
+    for phase, metric in PHASE_METRIC_COLUMNS:
+        column = array('d', (r['phases'][phase][metric] for r in all_results))
+        ordered = sorted(column)
+        summary[f"{phase}.{metric}"] = {
+            'min': ordered[0],
+            'max': ordered[-1],
+            'mean': math.fsum(column) / len(column),
+            'p95': ordered[math.ceil(0.95 * len(ordered)) - 1],
+        }
+    return summary
+
+
+def _bytes_default(obj):
+    """Encode bytes values (hashes, capsules) as hex strings"""
+    if isinstance(obj, (bytes, bytearray)):
+        return obj.hex()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _dumps(obj) -> bytes:
+    """Serialize results as indented JSON"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_bytes_default, option=orjson.OPT_INDENT_2)
+    return json.dumps(obj, indent=2, default=_bytes_default).encode()
+
+
+def _iter_csv_rows(metrics: Dict):
+    """Yield the (metric_type, metric_name, value) rows of the CSV summary"""
+    # Overall metrics
+    yield 'overall', 'total_time_ms', metrics['overall']['total_time_ms']
+    
+    # Phase-specific metrics
+    for phase_name, phase_data in metrics['phases'].items():
+        if isinstance(phase_data, dict):
+            for key, value in phase_data.items():
+                if key in _CSV_TIME_KEYS and isinstance(value, (int, float)):
+                    yield phase_name, key, value
+    
+    # Resource metrics
+    for key, value in metrics['resources'].items():
+        if isinstance(value, (int, float)):
+            yield 'resources', key, value
+
+
+def _save_pair(json_bytes: bytes, json_path: Path, csv_bytes: bytes, csv_path: Path):
+    """Write the JSON and CSV results with one open/write/close each"""
+    for data, path in ((json_bytes, json_path), (csv_bytes, csv_path)):
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+        finally:
+            os.close(fd)
+
+
+def _bulk_unlink(paths):
+    """
+    Remove files, opening each parent directory once and unlinking the
+    entries relative to it (unlinkat) instead of resolving every full path.
+    """
+    by_dir: Dict[str, List[str]] = {}
+    for path in paths:
+        directory, name = os.path.split(os.fspath(path))
+        by_dir.setdefault(directory or '.', []).append(name)
+    for directory, names in by_dir.items():
+        if os.unlink not in os.supports_dir_fd:
+            for name in names:
+                os.unlink(os.path.join(directory, name))
+            continue
+        dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            for name in names:
+                os.unlink(name, dir_fd=dir_fd)
+        finally:
+            os.close(dir_fd)
+
 
 class SimulationRunner:
     """Runs the complete 8-phase simulation and collects metrics"""
     
-    def __init__(self, keys_dir: Path, results_dir: Path, ipfs_addr='/ip4/127.0.0.1/tcp/5001'):
+    def __init__(self, keys_dir: Path, results_dir: Path, ipfs_addr='/ip4/127.0.0.1/tcp/5001',
+                 batch_uploads: bool = False):
         self.keys_dir = Path(keys_dir)
         self.results_dir = Path(results_dir)
         self.ipfs_addr = ipfs_addr
+        self.batch_uploads = batch_uploads
         self.results_dir.mkdir(parents=True, exist_ok=True)
+        self.simulator = PhaseSimulator(self.keys_dir, self.ipfs_addr, self.batch_uploads)
+        # Wall-clock time is read once; later timestamps add the monotonic
+        # offset, so no clock/timezone lookup happens between phases
+        self._base_dt = datetime.now()
+        self._base_perf_ns = time.perf_counter_ns()
+        self._log = io.StringIO()
         self.reset()
         
     def reset(self):
         """Reset all simulation state"""
-        self.simulator = PhaseSimulator(self.keys_dir, self.ipfs_addr)
+        # The simulator (keys, IPFS session) is built once in __init__;
+        # only its per-run state is cleared here
+        self.simulator.reset_run_state()
         self.monitor = ResourceMonitor()
         self.all_metrics: List[Dict] = []
-        # Clear keys directory
-        import shutil
-        for item in self.keys_dir.glob('*'):
-            if item.is_dir():
-                shutil.rmtree(item)
+    
+    def _now(self) -> datetime:
+        """Current local time, derived from the cached base timestamp"""
+        return self._base_dt + timedelta(microseconds=(time.perf_counter_ns() - self._base_perf_ns) / 1e3)
+    
+    def _clean_all(self):
+        """Remove keys, results and IPFS records left over from earlier runs"""
+        # Clear keys directory (scandir entries carry the file type, so no
+        # extra stat per entry)
+        with os.scandir(self.keys_dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    shutil.rmtree(entry.path)
         # Clear results directory
-        for item in self.results_dir.glob('*'):
-            item.unlink()
-        # Clear IPFS files
+        with os.scandir(self.results_dir) as entries:
+            _bulk_unlink([entry.path for entry in entries])
+        # Clear IPFS files (over the simulator's keep-alive API session)
         try:
-            import subprocess
-            subprocess.run(['ipfs', 'files', 'rm', '-r', '/records'], stderr=subprocess.DEVNULL)
+            self.simulator.ipfs.remove_records()
         except Exception:
             pass  # Ignore errors when clearing IPFS files
     
@@ -54,18 +230,32 @@ class SimulationRunner:
         Run all 8 phases and collect metrics.
         Returns complete metrics dictionary.
         """
+        # Progress output (including IPFSManager's) is buffered and written out
+        # once the run ends, so no stdout writes land inside the timed phases
+        try:
+            with redirect_stdout(self._log):
+                return self._run_phases(patient_id, doctor_id, viewer_id, record_id,
+                                        test_data, original_filename)
+        finally:
+            sys.stdout.write(self._log.getvalue())
+            sys.stdout.flush()
+            self._log.seek(0)
+            self._log.truncate()
+    
+    def _run_phases(self, patient_id: str, doctor_id: str, viewer_id: str,
+                    record_id: str, test_data: bytes, original_filename: str = None) -> Dict:
+        """Run all 8 phases, printing progress, and compile the metrics"""
         print("\n" + "="*80)
         print("Starting Full 8-Phase Simulation")
         print("="*80)
         
-        overall_start = time.perf_counter()
+        overall_start = time.perf_counter_ns()
         # Removed blocking resource monitor start to avoid adding sampling overhead
         # self.monitor.start()
         phase_metrics = {}
         
         try:
             # PHASE 1: User Registration
-            print("\n[PHASE 1] User Registration...")
             phase1_patient = self.simulator.phase1_user_registration(patient_id, Role.PATIENT)
             phase1_doctor = self.simulator.phase1_user_registration(doctor_id, Role.DOCTOR)
             phase1_viewer = self.simulator.phase1_user_registration(viewer_id, Role.VIEWER)
@@ -77,45 +267,39 @@ class SimulationRunner:
                                phase1_doctor['total_time_ms'] + 
                                phase1_viewer['total_time_ms']
             }
-            print(f"  ✓ Phase 1 completed ({phase_metrics['phase1']['total_time_ms']:.2f} ms)")
+            print(_PHASE_TEMPLATES[1].format(t=phase_metrics['phase1']['total_time_ms']))
             
             # PHASE 2: Data Encryption
-            print("\n[PHASE 2] Data Encryption...")
             phase2 = self.simulator.phase2_data_encryption(test_data, patient_id, record_id)
             phase_metrics['phase2'] = phase2
             original_capsule = phase2['capsule']
-            print(f"  ✓ Phase 2 completed ({phase2['encrypt_time_ms']:.2f} ms)")
+            print(_PHASE_TEMPLATES[2].format(t=phase2['encrypt_time_ms']))
             
             # PHASE 3: IPFS Storage
-            print("\n[PHASE 3] IPFS Storage...")
             phase3 = self.simulator.phase3_ipfs_storage(phase2['ciphertext'], test_data, record_id, original_filename=original_filename)
             phase_metrics['phase3'] = phase3
-            print(f"  ✓ Phase 3 completed ({phase3['total_time_ms']:.2f} ms)")
+            print(_PHASE_TEMPLATES[3].format(t=phase3['total_time_ms']))
             
             # PHASE 4: On-chain Storage
-            print("\n[PHASE 4] On-chain Storage...")
             phase4 = self.simulator.phase4_onchain_storage(
                 record_id, patient_id, doctor_id, phase3['encrypted_cid'], phase2['cipher_hash']
             )
             phase_metrics['phase4'] = phase4
-            print(f"  ✓ Phase 4 completed ({phase4['blockchain_time_ms']:.2f} ms)")
+            print(_PHASE_TEMPLATES[4].format(t=phase4['blockchain_time_ms']))
             
             # PHASE 5: Access Request
-            print("\n[PHASE 5] Access Request...")
             phase5 = self.simulator.phase5_access_request(patient_id, viewer_id, record_id)
             phase_metrics['phase5'] = phase5
-            print(f"  ✓ Phase 5 completed ({phase5['blockchain_time_ms']:.2f} ms)")
+            print(_PHASE_TEMPLATES[5].format(t=phase5['blockchain_time_ms']))
             
             # PHASE 6: Consent Approval + PRE
-            print("\n[PHASE 6] Consent Approval + Proxy Re-Encryption...")
             phase6 = self.simulator.phase6_consent_approval_pre(
                 patient_id, viewer_id, record_id, original_capsule
             )
             phase_metrics['phase6'] = phase6
-            print(f"  ✓ Phase 6 completed ({phase6['total_time_ms']:.2f} ms)")
+            print(_PHASE_TEMPLATES[6].format(t=phase6['total_time_ms']))
             
             # PHASE 7: Data Retrieval + Decryption
-            print("\n[PHASE 7] Data Retrieval + Decryption...")
             phase7 = self.simulator.phase7_data_retrieval_decryption(
                 viewer_id, record_id, patient_id, original_capsule
             )
@@ -123,25 +307,23 @@ class SimulationRunner:
             
             # Verify decryption
             if phase7['plaintext_size_bytes'] == len(test_data):
-                print(f"  ✓ Phase 7 completed ({phase7['total_time_ms']:.2f} ms)")
-                print(f"  ✓ Decryption verified: {len(test_data)} bytes")
+                print(_PHASE7_VERIFIED.format(t=phase7['total_time_ms'], size=len(test_data)))
             else:
-                print(f"  ⚠ Phase 7 completed but size mismatch!")
+                print(_PHASE7_MISMATCH)
             
             # PHASE 8: Access Revocation
-            print("\n[PHASE 8] Access Revocation...")
             phase8 = self.simulator.phase8_access_revocation(patient_id, viewer_id, record_id)
             phase_metrics['phase8'] = phase8
-            print(f"  ✓ Phase 8 completed ({phase8['blockchain_time_ms']:.2f} ms)")
+            print(_PHASE_TEMPLATES[8].format(t=phase8['blockchain_time_ms']))
             
-            overall_time = (time.perf_counter() - overall_start) * 1000  # ms
+            overall_time = (time.perf_counter_ns() - overall_start) / 1e6  # ms
             # Resource monitoring disabled to avoid sampling overhead that skews timings
             # self.monitor.stop()
             resource_stats = {}  # keep key for compatibility with save_metrics
             
             # Compile final metrics
             final_metrics = {
-                'timestamp': datetime.now().isoformat(),
+                'timestamp': self._now().isoformat(),
                 'record_id': record_id,
                 'patient_id': patient_id,
                 'doctor_id': doctor_id,
@@ -165,111 +347,166 @@ class SimulationRunner:
             
         except Exception as e:
             # Resource monitor was not started to avoid blocking; nothing to stop
-            print(f"\n❌ Simulation failed: {e}")
+            # Headers are printed when a phase completes, so name the failed one
+            # here: the phases store their metrics in order, one key each
+            failed = len(phase_metrics) + 1
+            if failed <= len(_PHASE_NAMES):
+                print(f"\n[PHASE {failed}] {_PHASE_NAMES[failed - 1]}...")
+                print(f"\n❌ Simulation failed in phase {failed}: {e}")
+            else:
+                print(f"\n❌ Simulation failed: {e}")
             raise
     
     def save_metrics(self, metrics: Dict, filename: str = None):
         """Save metrics to JSON and CSV files"""
+        json_path, csv_path = self._write_metrics(metrics, filename)
+        print(f"Saved metrics to: {json_path}")
+        print(f"Saved CSV summary to: {csv_path}")
+    
+    def _write_metrics(self, metrics: Dict, filename: str = None):
+        """Write metrics to JSON and CSV files without printing; returns both paths"""
         if filename is None:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            timestamp = self._now().strftime("%Y%m%d_%H%M%S")
             filename = f"simulation_{timestamp}"
         
         json_path = self.results_dir / f"{filename}.json"
         csv_path = self.results_dir / f"{filename}.csv"
         
-        # Save JSON
-        # Convert bytes to string for JSON serialization
-        def convert_bytes(obj):
-            if isinstance(obj, bytes):
-                return obj.hex()
-            return obj
-
-        def sanitize_for_json(d):
-            if isinstance(d, dict):
-                return {k: sanitize_for_json(v) for k, v in d.items()}
-            elif isinstance(d, list):
-                return [sanitize_for_json(x) for x in d]
-            else:
-                return convert_bytes(d)
-
-        json_path.write_text(json.dumps(sanitize_for_json(metrics), indent=2))
-        print(f"Saved metrics to: {json_path}")
+        # Save JSON (bytes values, e.g. hashes, are written as hex)
+        json_bytes = _dumps(metrics)
         
         # Save CSV summary
-        csv_rows = []
-        
-        # Overall metrics
-        csv_rows.append({
-            'metric_type': 'overall',
-            'metric_name': 'total_time_ms',
-            'value': metrics['overall']['total_time_ms']
-        })
-        
-        # Phase-specific metrics
-        for phase_name, phase_data in metrics['phases'].items():
-            if isinstance(phase_data, dict):
-                for key, value in phase_data.items():
-                    if isinstance(value, (int, float)) and ('time' in key.lower() or 'ms' in key.lower()):
-                        csv_rows.append({
-                            'metric_type': phase_name,
-                            'metric_name': key,
-                            'value': value
-                        })
+        buf = io.StringIO(newline='')
+        writer = csv.writer(buf)
+        writer.writerow(('metric_type', 'metric_name', 'value'))
+        writer.writerows(_iter_csv_rows(metrics))
+        csv_bytes = buf.getvalue().encode()
         
-        # Resource metrics
-        for key, value in metrics['resources'].items():
-            if isinstance(value, (int, float)):
-                csv_rows.append({
-                    'metric_type': 'resources',
-                    'metric_name': key,
-                    'value': value
-                })
-        
-        if csv_rows:
-            with csv_path.open('w', newline='') as f:
-                writer = csv.DictWriter(f, fieldnames=['metric_type', 'metric_name', 'value'])
-                writer.writeheader()
-                writer.writerows(csv_rows)
-            print(f"Saved CSV summary to: {csv_path}")
+        # Both blobs are complete in memory; write them out back to back
+        _save_pair(json_bytes, json_path, csv_bytes, csv_path)
+        return json_path, csv_path
     
-    def run_batch(self, num_runs: int, data_size: int = 1024):
-        """Run multiple simulations for throughput analysis"""
+    def run_batch(self, num_runs: int, data_size: int = 1024, workers: int = 1):
+        """
+        Run multiple simulations for throughput analysis.
+        With workers > 1 the runs are spread over that many processes.
+        """
         print(f"\nRunning batch simulation: {num_runs} runs with {data_size} bytes data")
         
         all_results = []
         
-        for i in range(num_runs):
-            print(f"\n--- Run {i+1}/{num_runs} ---")
-            patient_id = f"P{i+1}"
-            doctor_id = f"D{i+1}"
-            viewer_id = f"V{i+1}"
-            record_id = f"R{i+1}"
-            test_data = b"A" * data_size  # Simple test data
+        if workers > 1:
+            jobs = [(self.keys_dir, self.results_dir, self.ipfs_addr, self.batch_uploads, i + 1, data_size)
+                    for i in range(num_runs)]
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {pool.submit(_run_one, job): job[4] for job in jobs}
+                for future in as_completed(futures):
+                    try:
+                        all_results.append(future.result())
+                    except Exception as e:
+                        print(f"Run {futures[future]} failed: {e}")
+        else:
+            test_data = _test_data(data_size)
+            pending_saves = []
+            # A single writer thread keeps batch result files in submission order
+            with ThreadPoolExecutor(max_workers=1) as writer:
+                for i in range(num_runs):
+                    print(f"\n--- Run {i+1}/{num_runs} ---")
+                    # Fresh per-run state and keys subdirectory, so nothing is wiped mid-batch
+                    self.simulator.reset(self.keys_dir / f"run_{i+1}")
+                    patient_id = f"P{i+1}"
+                    doctor_id = f"D{i+1}"
+                    viewer_id = f"V{i+1}"
+                    record_id = f"R{i+1}"
+                    # The previous run's files are written while this run is set up,
+                    # but not while it is timed: serialising on the writer thread
+                    # would compete for the GIL and skew the phase latencies
+                    if pending_saves:
+                        wait([pending_saves[-1][1]])
+                    
+                    try:
+                        metrics = self.run_full_simulation(patient_id, doctor_id, viewer_id, record_id, test_data)
+                        all_results.append(metrics)
+                        # The writer must not print, as the next run has stdout redirected
+                        pending_saves.append((i + 1, writer.submit(self._write_metrics, metrics, f"run_{i+1}")))
+                    except Exception as e:
+                        print(f"Run {i+1} failed: {e}")
+                        continue
             
-            try:
-                metrics = self.run_full_simulation(patient_id, doctor_id, viewer_id, record_id, test_data)
-                all_results.append(metrics)
-                self.save_metrics(metrics, f"run_{i+1}")
-            except Exception as e:
-                print(f"Run {i+1} failed: {e}")
-                continue
+            # Every run's files are on disk before the aggregate is written
+            for run, future in pending_saves:
+                try:
+                    json_path, csv_path = future.result()
+                    print(f"Saved metrics to: {json_path}")
+                    print(f"Saved CSV summary to: {csv_path}")
+                except Exception as e:
+                    print(f"Run {run} failed: {e}")
         
         # Calculate aggregate statistics
         if all_results:
-            total_times = [r['overall']['total_time_ms'] for r in all_results]
+            # Single pass over the runs for sum, min and max
+            total = 0.0
+            lowest = math.inf
+            highest = -math.inf
+            for r in all_results:
+                t = r['overall']['total_time_ms']
+                total += t
+                if t < lowest:
+                    lowest = t
+                if t > highest:
+                    highest = t
             aggregate = {
                 'num_runs': len(all_results),
                 'data_size_bytes': data_size,
-                'avg_total_time_ms': sum(total_times) / len(total_times),
-                'min_total_time_ms': min(total_times),
-                'max_total_time_ms': max(total_times)
+                'avg_total_time_ms': total / len(all_results),
+                'min_total_time_ms': lowest,
+                'max_total_time_ms': highest,
+                'phase_metrics': _aggregate_phase_metrics(all_results)
             }
             
             aggregate_path = self.results_dir / "batch_aggregate.json"
-            aggregate_path.write_text(json.dumps(aggregate, indent=2))
+            aggregate_path.write_bytes(_dumps(aggregate))
             print(f"\nBatch aggregate saved to: {aggregate_path}")
 
 
+@lru_cache(maxsize=None)
+def _test_data(data_size: int) -> bytes:
+    """
+    Simple batch test data, built once per size (and per worker process).
+    bytes are immutable and only read by the phases, so all runs share it.
+    """
+    return b"A" * data_size
+
+
+@contextmanager
+def _map_dataset(path: Path):
+    """Map a dataset file read-only and yield a memoryview over its contents"""
+    with map_file(path) as mm:
+        view = memoryview(mm)
+        try:
+            yield view
+        finally:
+            # The map can only be closed once no view is left on it
+            view.release()
+
+
+def _run_one(job) -> Dict:
+    """
+    Run and save one batch run in a worker process.
+    Each run has its own IDs, keys subdirectory and IPFS names, so workers
+    share nothing but the results directory.
+    """
+    keys_dir, results_dir, ipfs_addr, batch_uploads, run, data_size = job
+    runner = SimulationRunner(Path(keys_dir) / f"run_{run}", results_dir, ipfs_addr, batch_uploads)
+    try:
+        print(f"\n--- Run {run} ---")
+        metrics = runner.run_full_simulation(f"P{run}", f"D{run}", f"V{run}", f"R{run}", _test_data(data_size))
+        runner.save_metrics(metrics, f"run_{run}")
+        return metrics
+    finally:
+        runner.simulator.close()
+
+
 def main():
     parser = argparse.ArgumentParser(description='Run 8-phase healthcare data sharing simulation')
     parser.add_argument('--patient', default='P1', help='Patient ID')
@@ -281,6 +518,12 @@ def main():
     parser.add_argument('--results-dir', default='results', help='Directory for storing results')
     parser.add_argument('--ipfs-addr', default='/ip4/127.0.0.1/tcp/5001', help='IPFS API address')
     parser.add_argument('--batch', type=int, help='Run batch simulation with N runs')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Processes to spread --batch runs over (default: 1)')
+    parser.add_argument('--batch-uploads', action='store_true',
+                        help='Send the phase 3 IPFS uploads in a single add request')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile the run with cProfile and save profile.pstats to the results directory')
     
     args = parser.parse_args()
     
@@ -288,29 +531,42 @@ def main():
     results_dir = Path(args.results_dir)
     dataset_path = Path(args.dataset)
     
-    runner = SimulationRunner(keys_dir, results_dir, args.ipfs_addr)
-    # Reset all state before running
-    runner.reset()
+    # The constructor already resets the in-memory state; only the leftovers
+    # of earlier invocations on disk and in IPFS need clearing
+    runner = SimulationRunner(keys_dir, results_dir, args.ipfs_addr, args.batch_uploads)
+    runner._clean_all()
     
-    if args.batch:
-        runner.run_batch(args.batch)
-    else:
-        # Read test data from dataset file
-        try:
-            test_data = dataset_path.read_bytes()
-            print(f"\nRead {len(test_data)} bytes from dataset")
-            
-            metrics = runner.run_full_simulation(
-                args.patient, args.doctor, args.viewer, args.record, test_data, original_filename=dataset_path.name
-            )
-            
-            runner.save_metrics(metrics)
-        except FileNotFoundError:
-            print(f"Error: Dataset file not found: {dataset_path}")
-            sys.exit(1)
-        except Exception as e:
-            print(f"Error: Failed to process dataset: {e}")
-            sys.exit(1)
+    # Optional cProfile of the whole run; the stats land next to the results
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        if args.batch:
+            runner.run_batch(args.batch, workers=args.workers)
+        else:
+            # Map the dataset read-only: the phases read it through a memoryview,
+            # so it is never copied onto the Python heap
+            try:
+                with _map_dataset(dataset_path) as test_data:
+                    print(f"\nRead {len(test_data)} bytes from dataset")
+                
+                    metrics = runner.run_full_simulation(
+                        args.patient, args.doctor, args.viewer, args.record, test_data, original_filename=dataset_path.name
+                    )
+                
+                    runner.save_metrics(metrics)
+            except FileNotFoundError:
+                print(f"Error: Dataset file not found: {dataset_path}")
+                sys.exit(1)
+            except Exception as e:
+                print(f"Error: Failed to process dataset: {e}")
+                sys.exit(1)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profile_path = results_dir / 'profile.pstats'
+            profiler.dump_stats(profile_path)
+            print(f"Profile saved to: {profile_path}")
 
 
 if __name__ == '__main__':